@@ -0,0 +1,222 @@
+import math
+import os
+import threading
+import time
+from functools import wraps
+
+from dotenv import load_dotenv
+from flask import jsonify, request
+
+from pipeline import parse_request_datetime
+from prescore import parse_range
+from streaming import MAX_SUBSCRIBERS as MAX_STREAMS
+
+load_dotenv()
+
+# Perkiraan jumlah titik data per hari dari API eksternal, dipakai untuk menaksir biaya request
+POINTS_PER_DAY = int(os.getenv('ADMISSION_POINTS_PER_DAY', 1440))
+TIME_STEPS = 30
+# Request dengan perkiraan jumlah window di atas batas ini masuk jalur "heavy"
+HEAVY_WINDOWS = int(os.getenv('ADMISSION_HEAVY_WINDOWS', 10000))
+# Request yang sedang berjalan maupun yang menunggu di antrian sama-sama memakai satu thread gthread,
+# begitu juga setiap stream SSE yang terbuka. Total request prediksi (semua jalur) ditambah batas stream
+# dibatasi WORKER_THREADS - 1, sehingga selalu ada satu thread tersisa untuk route ringan
+# (/health, /auth/login). serve.py memeriksa batas ini saat start
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', 4))
+MAX_ADMITTED = int(os.getenv('ADMISSION_MAX_ADMITTED', max(WORKER_THREADS - 1 - MAX_STREAMS, 1)))
+
+
+# Batas jumlah thread request yang boleh dipakai endpoint prediksi (per proses), tanpa menunggu
+class ThreadBudget:
+    def __init__(self, limit):
+        self.limit = limit
+        self.used = 0
+        self.shed = 0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        with self._lock:
+            if self.used >= self.limit:
+                self.shed += 1
+                return False
+            self.used += 1
+            return True
+
+    def release(self):
+        with self._lock:
+            self.used -= 1
+
+    def metrics(self):
+        with self._lock:
+            return {'limit': self.limit, 'used': self.used, 'shed': self.shed}
+
+
+# Antrian terbatas untuk satu jalur request (per proses)
+class AdmissionLane:
+    def __init__(self, name, max_concurrent, max_queue, queue_timeout):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.in_flight = 0
+        self.queued = 0
+        self.admitted = 0
+        self.shed_queue_full = 0
+        self.shed_timeout = 0
+        self.avg_duration = 1.0
+        self._cond = threading.Condition()
+
+    # Perkiraan waktu tunggu (detik) untuk header Retry-After
+    def retry_after(self):
+        waiting = self.queued + self.in_flight
+        return max(1, math.ceil(self.avg_duration * waiting / self.max_concurrent))
+
+    # Mengembalikan None jika request diterima, atau kode status (429/503) jika ditolak
+    def acquire(self):
+        with self._cond:
+            if self.in_flight < self.max_concurrent and self.queued == 0:
+                self.in_flight += 1
+                self.admitted += 1
+                return None
+
+            # Antrian penuh: tolak segera
+            if self.queued >= self.max_queue:
+                self.shed_queue_full += 1
+                return 429
+
+            self.queued += 1
+            deadline = time.monotonic() + self.queue_timeout
+            try:
+                while self.in_flight >= self.max_concurrent:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        # Terlalu lama menunggu di antrian
+                        self.shed_timeout += 1
+                        return 503
+                    self._cond.wait(remaining)
+            finally:
+                self.queued -= 1
+
+            self.in_flight += 1
+            self.admitted += 1
+            return None
+
+    def release(self, duration):
+        with self._cond:
+            self.in_flight -= 1
+            # Rata-rata bergerak eksponensial untuk durasi request
+            self.avg_duration = 0.8 * self.avg_duration + 0.2 * duration
+            self._cond.notify()
+
+    def metrics(self):
+        with self._cond:
+            return {
+                'max_concurrent': self.max_concurrent,
+                'max_queue': self.max_queue,
+                'in_flight': self.in_flight,
+                'queue_depth': self.queued,
+                'admitted': self.admitted,
+                'shed_queue_full': self.shed_queue_full,
+                'shed_timeout': self.shed_timeout,
+                'avg_duration_seconds': round(self.avg_duration, 3),
+            }
+
+
+THREAD_BUDGET = ThreadBudget(MAX_ADMITTED)
+
+# Jalur untuk endpoint prediksi. Request yang diterima THREAD_BUDGET lalu dibagi per jalur
+LANES = {
+    'heavy': AdmissionLane('heavy',
+                           int(os.getenv('ADMISSION_MAX_HEAVY', 1)),
+                           int(os.getenv('ADMISSION_HEAVY_QUEUE', 2)),
+                           float(os.getenv('ADMISSION_HEAVY_TIMEOUT', 10))),
+    'light': AdmissionLane('light',
+                           int(os.getenv('ADMISSION_MAX_LIGHT', 2)),
+                           int(os.getenv('ADMISSION_LIGHT_QUEUE', 8)),
+                           float(os.getenv('ADMISSION_LIGHT_TIMEOUT', 5))),
+}
+
+
+# Fungsi untuk menaksir jumlah window dari rentang tanggal (DDMMYYYY atau ISO 8601) sebelum data diambil
+def estimate_windows(start_date, end_date):
+    try:
+        start = parse_request_datetime(start_date)
+        end = parse_request_datetime(end_date)
+    except (TypeError, ValueError):
+        # Input tidak valid akan ditolak oleh endpoint, anggap murah
+        return 0
+    days = max((end - start).total_seconds() / 86400, 0)
+    return max(int(days * POINTS_PER_DAY) - TIME_STEPS, 0)
+
+
+# Perkiraan rata-rata ukuran satu titik data di body POST (JSON record dan biner)
+JSON_BYTES_PER_POINT = 16
+BINARY_BYTES_PER_POINT = 12
+
+
+# Perkiraan jumlah window yang benar-benar dinilai, dengan memperhitungkan parameter stride dan budget
+def estimate_prediction_cost():
+    windows = estimate_request_windows()
+    stride = request.args.get('stride', 1, type=int) or 1
+    budget = request.args.get('budget', type=int)
+    windows //= max(stride, 1)
+    if budget and budget > 0:
+        windows = min(windows, budget)
+    return windows
+
+
+# Perkiraan jumlah window: dari ukuran body untuk POST, dari range atau start_date dan end_date untuk GET
+def estimate_request_windows():
+    if request.method == 'POST':
+        bytes_per_point = (BINARY_BYTES_PER_POINT if request.mimetype == 'application/octet-stream'
+                           else JSON_BYTES_PER_POINT)
+        return max((request.content_length or 0) // bytes_per_point - TIME_STEPS, 0)
+    if request.args.get('range'):
+        try:
+            days = parse_range(request.args['range']).total_seconds() / 86400
+        except ValueError:
+            return 0
+        return max(int(days * POINTS_PER_DAY) - TIME_STEPS, 0)
+    return estimate_windows(request.args.get('start_date'), request.args.get('end_date'))
+
+
+# Response 429/503 dengan perkiraan waktu tunggu di header Retry-After
+def rejected(lane, status):
+    message = 'Too many requests in queue' if status == 429 else 'Server is busy'
+    response = jsonify({'error': f'{message}, please retry later', 'lane': lane.name})
+    response.status_code = status
+    response.headers['Retry-After'] = str(lane.retry_after())
+    return response
+
+
+# Decorator untuk membatasi request prediksi yang berjalan bersamaan (admission control)
+def admission_controlled(estimate_cost=estimate_prediction_cost):
+    def decorator(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            lane = LANES['heavy' if estimate_cost() > HEAVY_WINDOWS else 'light']
+
+            # Semua thread untuk prediksi sudah terpakai (berjalan atau menunggu): tolak segera
+            if not THREAD_BUDGET.try_acquire():
+                return rejected(lane, 429)
+            try:
+                status = lane.acquire()
+                if status is not None:
+                    return rejected(lane, status)
+
+                start = time.monotonic()
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    lane.release(time.monotonic() - start)
+            finally:
+                THREAD_BUDGET.release()
+        return wrapper
+    return decorator
+
+
+# Ringkasan metrik semua jalur untuk endpoint /metrics
+def admission_metrics():
+    metrics = {name: lane.metrics() for name, lane in LANES.items()}
+    metrics['threads'] = THREAD_BUDGET.metrics()
+    return metrics
@@ -1,20 +1,24 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import pandas as pd
 import numpy as np
-from tensorflow.keras.models import load_model
-from tensorflow.keras.metrics import MeanAbsoluteError
-import requests
-from requests.auth import HTTPBasicAuth
 import os
 from dotenv import load_dotenv
 import json
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
+import time
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from flask_jwt_extended import (
     JWTManager, create_access_token, jwt_required, get_jwt_identity
 )
-from functools import wraps
+from functools import partial, wraps
+from admission import admission_controlled, admission_metrics
+from streaming import RETRY_AFTER as STREAM_RETRY_AFTER, StreamScorer
+from pipeline import (
+    DEFAULT_DEVICE, TIME_FORMATS, ExternalAPIError, ScoringPipeline, convert_date_format, format_epoch_ms,
+    load_sensor_specs, to_epoch_ms
+)
+from prescore import PRESETS, PrescoreScheduler, parse_presets, range_to_iso
 
 load_dotenv()
 
@@ -136,196 +140,277 @@ def delete_user(user_id):
     return jsonify({'message': 'User deleted successfully'}), 200
 
 
-model_conductivity = load_model('anomaly_detection_model_conductivity.h5', custom_objects={'mae': MeanAbsoluteError()})
-model_salinity = load_model('anomaly_detection_model_salinity.h5', custom_objects={'mae': MeanAbsoluteError()})
-
-# Fungsi untuk membuat sequences
-def create_sequences(X, time_col, time_steps=30):
-    Xs, times = [], []
-    for i in range(len(X) - time_steps):
-        v = X.iloc[i:(i + time_steps)].values
-        Xs.append(v)
-        times.append(time_col.iloc[i + time_steps])  # Simpan waktu dari indeks yang sesuai
-    return np.array(Xs), times
-
-# Fungsi untuk konversi format tanggal DDMMYYYY menjadi format ISO yang dibutuhkan API eksternal
-def convert_date_format(date_str):
-    # Mengubah DDMMYYYY menjadi format YYYY-MM-DDTHH:MM:SSZ
-    return datetime.strptime(date_str, "%d%m%Y").strftime("%Y-%m-%dT%H:%M:%SZ")
-
-# Fungsi untuk menentukan apakah nilai merupakan anomali berdasarkan aturan yang diberikan
-def detect_anomaly_salinity(mae_loss, value, threshold=0.2):
-    anomalies = []
-    for i in range(len(mae_loss)):
-        anomaly = False
-        if mae_loss[i] > threshold:  # Rule 1: Jika score loss > threshold (71)
-            anomaly = True
-        elif value[i] < 0:  # Rule 2: Jika value < 0
-            anomaly = True
-        elif value[i] > 7:  # Rule 3: Jika value > 1000
-            anomaly = True
-        # Rule 4: Jika semua aturan di atas False, anomaly tetap False
-        anomalies.append(anomaly)
-    return anomalies
-
-# Fungsi untuk menentukan apakah nilai merupakan anomali berdasarkan aturan yang diberikan
-def detect_anomaly_conductivity(mae_loss, value, threshold=71):
-    anomalies = []
-    for i in range(len(mae_loss)):
-        anomaly = False
-        if mae_loss[i] > threshold:  # Rule 1: Jika score loss > threshold (71)
-            anomaly = True
-        elif value[i] < 0:  # Rule 2: Jika value < 0
-            anomaly = True
-        elif value[i] > 1000:  # Rule 3: Jika value > 1000
-            anomaly = True
-        # Rule 4: Jika semua aturan di atas False, anomaly tetap False
-        anomalies.append(anomaly)
-    return anomalies
+# Pipeline scoring untuk semua sensor di sensors.json
+# Backend inferensi dipilih per sensor lewat INFERENCE_BACKEND_<SENSOR> (keras, tflite_fp16, tflite_int8)
+pipeline = ScoringPipeline(load_sensor_specs())
+pipeline.load_models()
 
-# Endpoint untuk mengambil data dari API eksternal berdasarkan input dinamis dan melakukan prediksi untuk conductivity
-@app.route('/predict_conductivity', methods=['GET'])
-@jwt_required()
-def predict_conductivity():
-    # Ambil input tanggal dari parameter URL, contoh: 06082024 dan 08082024
+
+# Fungsi untuk membaca parameter stride, budget dan time_format (iso atau epoch) dari URL
+def parse_scoring_args():
+    stride = request.args.get('stride', 1, type=int)
+    budget = request.args.get('budget', type=int)
+    time_format = request.args.get('time_format', 'iso')
+    if stride is None or stride < 1:
+        raise ValueError('stride must be a positive integer')
+    if budget is not None and budget < 1:
+        raise ValueError('budget must be a positive integer')
+    if time_format not in TIME_FORMATS:
+        raise ValueError(f"time_format must be one of: {', '.join(TIME_FORMATS)}")
+    return stride, budget, time_format
+
+
+# Fungsi untuk mengambil data dari API eksternal lalu melakukan prediksi (dipakai juga oleh scheduler pre-scoring)
+def score_external_range(device, sensor, start_date_iso, end_date_iso, stride=1, budget=None, time_format='iso'):
+    return pipeline.run(sensor, start_date_iso, end_date_iso, device, stride, budget, time_format=time_format)
+
+
+# Fungsi untuk melakukan prediksi dari API eksternal, dibatasi oleh admission control
+@admission_controlled()
+def predict_from_external_api(sensor, device, start_date_iso, end_date_iso, stride=1, budget=None, time_format='iso'):
+    try:
+        result = score_external_range(device, sensor, start_date_iso, end_date_iso, stride, budget, time_format)
+    except ExternalAPIError as e:
+        return jsonify(e.to_dict()), 400
+
+    # Mengembalikan hasil prediksi dalam bentuk JSON
+    return jsonify(result)
+
+
+# Fungsi untuk menangani request prediksi GET: dari hasil pre-scoring jika ada, atau langsung dari API eksternal
+def predict_sensor(sensor):
+    if sensor not in pipeline.specs:
+        return jsonify({'error': f"Unknown sensor '{sensor}'"}), 404
+
+    device = request.args.get('device', DEFAULT_DEVICE)
+    range_input = request.args.get('range')
+
+    try:
+        stride, budget, time_format = parse_scoring_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    if range_input:
+        # Rentang relatif (contoh: 24h, 7d) dilayani dari memori jika sudah di-pre-score
+        cached = prescore_scheduler.get(device, sensor, range_input)
+        if cached is not None:
+            result, scored_at = cached
+            # Hasil pre-scoring disimpan dengan waktu epoch, diformat ke ISO hanya jika diminta
+            if time_format == 'iso':
+                result = {**result, f'{sensor}_time': format_epoch_ms(result[f'{sensor}_time'])}
+            result = {
+                **result,
+                'prescored': True,
+                'scored_at': datetime.fromtimestamp(scored_at, timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+                'staleness_seconds': round(time.time() - scored_at, 1)
+            }
+            # Hasil pre-scoring selalu menilai semua window; stride dan budget tidak dipakai
+            if stride > 1 or budget is not None:
+                result['sampling_ignored'] = True
+            return jsonify(result)
+
+        try:
+            start_date_iso, end_date_iso = range_to_iso(range_input)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+        return predict_from_external_api(sensor, device, start_date_iso, end_date_iso, stride, budget, time_format)
+
+    # Ambil input tanggal dari parameter URL, contoh: 06082024 dan 08082024, atau 2024-08-06T06:00:00Z
     start_date_input = request.args.get('start_date')
     end_date_input = request.args.get('end_date')
 
     # Pastikan input tanggal valid
     if not start_date_input or not end_date_input:
-        return jsonify({'error': 'start_date and end_date parameters are required'}), 400
+        return jsonify({'error': 'start_date and end_date (or range) parameters are required'}), 400
 
     try:
-        # Konversi input DDMMYYYY ke format ISO
+        # Konversi input DDMMYYYY atau ISO 8601 ke format ISO
         start_date_iso = convert_date_format(start_date_input)
         end_date_iso = convert_date_format(end_date_input)
     except ValueError:
-        return jsonify({'error': 'Invalid date format. Use DDMMYYYY.'}), 400
-
-    # URL dan parameter API untuk mengambil data
-    url = os.getenv('EXTERNAL_API_URL')
-    params = {
-        "start": start_date_iso,  # Tanggal mulai dalam format ISO
-        "end": end_date_iso,  # Tanggal akhir dalam format ISO
-        "device": "AI349454596D98"
-    }
-
-    # Basic authentication
-    username = os.getenv('EXTERNAL_API_USERNAME')
-    password = os.getenv('EXTERNAL_API_PASSWORD')
-
-    # Mengambil data dari API eksternal
-    response = requests.get(url, params=params, auth=HTTPBasicAuth(username, password))
-
-    if response.status_code == 200:
-        # Mengambil data JSON
-        data = response.json()
-
-        # *** Conductivity Section ***
-        if 'conductivity' in data:
-            conductivity_data = pd.DataFrame(data['conductivity'])
-
-            # Membuat sequences untuk conductivity
-            time_steps = 30
-            X_test_conductivity, time_conductivity = create_sequences(
-                conductivity_data[['value']], conductivity_data['time'], time_steps)
-
-            # Prediksi menggunakan model conductivity
-            X_pred_test_conductivity = model_conductivity.predict(X_test_conductivity)
-
-            # Menghitung MAE loss untuk conductivity
-            mae_loss_test_conductivity = pd.DataFrame(
-                np.mean(np.abs(X_pred_test_conductivity - X_test_conductivity), axis=1), columns=['Error'])
-
-            # Deteksi anomali berdasarkan aturan yang diberikan
-            conductivity_anomaly = detect_anomaly_conductivity(mae_loss_test_conductivity['Error'].values,
-                                                               conductivity_data['value'].values)
-        else:
-            return jsonify({'error': 'Conductivity data not found in the response'}), 400
-
-        # Mengembalikan hasil prediksi dalam bentuk JSON untuk conductivity
-        return jsonify({
-            'conductivity_mae_loss': mae_loss_test_conductivity['Error'].tolist(),
-            'conductivity_time': time_conductivity,  # Menambahkan waktu untuk conductivity
-            'conductivity_value': conductivity_data['value'].tolist(),  # Menambahkan nilai asli conductivity
-            'conductivity_anomaly': conductivity_anomaly  # Menambahkan status anomali (True/False)
-        })
+        return jsonify({'error': 'Invalid date format. Use DDMMYYYY or an ISO 8601 datetime.'}), 400
+
+    return predict_from_external_api(sensor, device, start_date_iso, end_date_iso, stride, budget, time_format)
+
+
+# Scheduler untuk pre-scoring preset (device, sensor, range) yang sering dibuka, lihat PRESCORE_PRESETS
+prescore_scheduler = PrescoreScheduler(parse_presets(PRESETS, pipeline.specs), partial(score_external_range, time_format='epoch'))
+
+
+# Scheduler dijalankan sekali per proses, saat request pertama masuk
+@app.before_request
+def start_prescore_scheduler():
+    prescore_scheduler.start()
+
+
+# Record biner untuk body application/octet-stream: waktu epoch (ms, int64) + nilai (float32), little-endian
+BINARY_RECORD = np.dtype([('time', '<i8'), ('value', '<f4')])
+
+
+# Fungsi untuk membaca deret data dari body request POST (JSON atau biner).
+# Mengembalikan (frame, positional); positional True jika body tidak memiliki kolom waktu
+def parse_series_body():
+    if request.mimetype == 'application/octet-stream':
+        body = request.get_data()
+        if len(body) % BINARY_RECORD.itemsize:
+            raise ValueError(f'Binary body length must be a multiple of {BINARY_RECORD.itemsize} bytes')
+        records = np.frombuffer(body, dtype=BINARY_RECORD)
+        return pd.DataFrame({'time': records['time'], 'value': records['value'].astype(np.float64)}), False
+
+    data = request.get_json(silent=True)
+    if isinstance(data, dict):
+        # Format kolom: {"time": [...], "value": [...]}
+        values = data.get('value')
+        times = data.get('time')
+    elif isinstance(data, list):
+        # Format record: [{"time": ..., "value": ...}, ...]
+        if not all(isinstance(item, dict) and 'value' in item for item in data):
+            raise ValueError('Every item must be an object with a "value" field')
+        values = [item['value'] for item in data]
+        times = [item.get('time') for item in data]
     else:
-        return jsonify({'error': 'Failed to retrieve data from external API', 'status_code': response.status_code}), 400
+        raise ValueError('Body must be a JSON array or object, or application/octet-stream')
+
+    if not isinstance(values, list):
+        raise ValueError('"value" must be an array')
+    values = pd.to_numeric(pd.Series(values, dtype=object))
+    if times is None or all(t is None for t in times):
+        # Tanpa kolom waktu, gunakan posisi data sebagai waktu (bilangan bulat biasa, bukan epoch ms)
+        return pd.DataFrame({'time': np.arange(len(values), dtype=np.int64), 'value': values}), True
+    if len(times) != len(values):
+        raise ValueError('"time" and "value" must have the same length')
+
+    # Waktu (string ISO atau epoch ms) diubah sekali menjadi epoch ms int64
+    return pd.DataFrame({'time': to_epoch_ms(times), 'value': values}), False
+
+
+# Fungsi untuk melakukan prediksi pada deret data yang dikirim klien (tanpa mengambil data dari API eksternal)
+def predict_from_body(sensor):
+    if sensor not in pipeline.specs:
+        return jsonify({'error': f"Unknown sensor '{sensor}'"}), 404
+
+    try:
+        stride, budget, time_format = parse_scoring_args()
+        sensor_data, positional = parse_series_body()
+    except (ValueError, TypeError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    if positional:
+        # Resampling butuh waktu sungguhan; posisi akan dianggap milidetik dan masuk ke satu slot
+        if pipeline.specs[sensor].resample:
+            return jsonify({'error': f"'time' is required because {sensor} is resampled to a fixed cadence"}), 400
+        # Posisi dikembalikan apa adanya, tidak diformat sebagai waktu ISO
+        time_format = 'epoch'
 
+    time_steps = pipeline.specs[sensor].time_steps
+    if len(sensor_data) <= time_steps:
+        return jsonify({'error': f'At least {time_steps + 1} values are required'}), 400
 
+    return jsonify(pipeline.score(sensor, sensor_data, stride, budget, time_format=time_format))
+
+
+# Endpoint generik untuk semua sensor di sensors.json, contoh: /predict/conductivity
+@app.route('/predict/<sensor>', methods=['GET'])
+@jwt_required()
+def predict(sensor):
+    return predict_sensor(sensor)
+
+
+# Endpoint generik untuk prediksi dari data yang dikirim langsung oleh klien
+@app.route('/predict/<sensor>', methods=['POST'])
+@jwt_required()
+@admission_controlled()
+def score(sensor):
+    return predict_from_body(sensor)
+
+
+# Endpoint untuk mengambil data dari API eksternal berdasarkan input dinamis dan melakukan prediksi untuk conductivity
+@app.route('/predict_conductivity', methods=['GET'])
+@jwt_required()
+def predict_conductivity():
+    return predict_sensor('conductivity')
+
+
+# Endpoint untuk prediksi conductivity dari data yang dikirim langsung oleh klien
+@app.route('/predict_conductivity', methods=['POST'])
+@jwt_required()
+@admission_controlled()
+def score_conductivity():
+    return predict_from_body('conductivity')
+
+
+# Endpoint untuk mengambil data dari API eksternal berdasarkan input dinamis dan melakukan prediksi untuk salinity
 @app.route('/predict_salinity', methods=['GET'])
 @jwt_required()
 def predict_salinity():
-    # Ambil input tanggal dari parameter URL, contoh: 06082024 dan 08082024
-    start_date_input = request.args.get('start_date')
-    end_date_input = request.args.get('end_date')
+    return predict_sensor('salinity')
 
-    # Pastikan input tanggal valid
-    if not start_date_input or not end_date_input:
-        return jsonify({'error': 'start_date and end_date parameters are required'}), 400
 
-    try:
-        # Konversi input DDMMYYYY ke format ISO
-        start_date_iso = convert_date_format(start_date_input)
-        end_date_iso = convert_date_format(end_date_input)
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use DDMMYYYY.'}), 400
-
-    # URL dan parameter API untuk mengambil data
-    url = os.getenv('EXTERNAL_API_URL')
-    params = {
-        "start": start_date_iso,  # Tanggal mulai dalam format ISO
-        "end": end_date_iso,  # Tanggal akhir dalam format ISO
-        "device": "AI349454596D98"
-    }
-
-    # Basic authentication
-    username = os.getenv('EXTERNAL_API_USERNAME')
-    password = os.getenv('EXTERNAL_API_PASSWORD')
-
-    # Mengambil data dari API eksternal
-    response = requests.get(url, params=params, auth=HTTPBasicAuth(username, password))
-
-    if response.status_code == 200:
-        # Mengambil data JSON
-        data = response.json()
-
-        # *** Salinity Section ***
-        if 'salinity' in data:
-            salinity_data = pd.DataFrame(data['salinity'])
-
-            # Membuat sequences untuk salinity
-            time_steps = 30
-            X_test_salinity, time_salinity = create_sequences(
-                salinity_data[['value']], salinity_data['time'], time_steps)
-
-            # Prediksi menggunakan model salinity
-            X_pred_test_salinity = model_salinity.predict(X_test_salinity)
-
-            # Menghitung MAE loss untuk salinity
-            mae_loss_test_salinity = pd.DataFrame(np.mean(np.abs(X_pred_test_salinity - X_test_salinity), axis=1),
-                                                  columns=['Error'])
-
-            # Deteksi anomali berdasarkan aturan yang diberikan
-            salinity_anomaly = detect_anomaly_salinity(mae_loss_test_salinity['Error'].values,
-                                                       salinity_data['value'].values)
-        else:
-            return jsonify({'error': 'Salinity data not found in the response'}), 400
-
-        # Mengembalikan hasil prediksi dalam bentuk JSON untuk salinity
-        return jsonify({
-            'salinity_mae_loss': mae_loss_test_salinity['Error'].tolist(),
-            'salinity_time': time_salinity,  # Menambahkan waktu untuk salinity
-            'salinity_value': salinity_data['value'].tolist(),  # Menambahkan nilai asli salinity
-            'salinity_anomaly': salinity_anomaly  # Menambahkan status anomali (True/False)
-        })
-    else:
-        return jsonify({'error': 'Failed to retrieve data from external API', 'status_code': response.status_code}), 400
+# Endpoint untuk prediksi salinity dari data yang dikirim langsung oleh klien
+@app.route('/predict_salinity', methods=['POST'])
+@jwt_required()
+@admission_controlled()
+def score_salinity():
+    return predict_from_body('salinity')
+
+
+# Scoring real-time untuk data yang dikirim device (ring buffer per device dan sensor)
+stream_scorer = StreamScorer(pipeline)
+
+
+# Endpoint untuk menerima titik data dari device atau relay
+# Body: {"device": ..., "sensor": ..., "time": ..., "value": ...} atau array dari objek tersebut
+@app.route('/ingest', methods=['POST'])
+@jwt_required()
+def ingest():
+    data = request.get_json(silent=True)
+    points = data if isinstance(data, list) else [data]
+
+    accepted, windows = 0, 0
+    for point in points:
+        if not isinstance(point, dict) or not all(k in point for k in ['device', 'sensor', 'value']):
+            return jsonify({'error': 'Each point requires device, sensor and value',
+                            'accepted': accepted}), 400
+        try:
+            windows += stream_scorer.ingest(point['device'], point['sensor'], point.get('time'), point['value'])
+        except (ValueError, TypeError) as e:
+            return jsonify({'error': str(e), 'accepted': accepted}), 400
+        accepted += 1
+
+    return jsonify({'accepted': accepted, 'windows_queued': windows}), 202
+
+
+# Endpoint Server-Sent Events untuk menerima event anomali secara real-time
+# Parameter opsional: device dan sensor untuk memfilter event
+@app.route('/stream/anomalies', methods=['GET'])
+@jwt_required()
+def stream_anomalies():
+    subscriber = stream_scorer.subscribe()
+    if subscriber is None:
+        # Batas stream per worker tercapai: thread yang tersisa dicadangkan untuk route lain
+        response = jsonify({'error': 'Too many open streams, please retry later'})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(STREAM_RETRY_AFTER)
+        return response
+
+    events = stream_scorer.event_stream(subscriber, request.args.get('device'), request.args.get('sensor'))
+    response = Response(stream_with_context(events), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # Juga dilepas jika klien putus sebelum generator sempat berjalan
+    response.call_on_close(partial(stream_scorer.unsubscribe, subscriber))
+    return response
 
 @app.route('/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'API is running and healthy'}), 200
 
+# Metrik admission control (kedalaman antrian dan jumlah request yang ditolak) per proses
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    return jsonify({'pid': os.getpid(), 'admission': admission_metrics(), 'streaming': stream_scorer.metrics(),
+                    'prescore': prescore_scheduler.metrics(),
+                    'pipeline': pipeline.stage_metrics()}), 200
+
 if __name__ == '__main__':
     app.run(debug=True)
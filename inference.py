@@ -0,0 +1,174 @@
+import os
+import threading
+
+import numpy as np
+
+# Backend yang didukung:
+# - keras       : model .h5 float32 asli (referensi)
+# - tflite_fp16 : TFLite dengan bobot float16
+# - tflite_int8 : TFLite dengan kuantisasi dynamic-range int8
+BACKENDS = ('keras', 'tflite_fp16', 'tflite_int8')
+DEFAULT_BACKEND = 'keras'
+
+
+# Fungsi untuk memuat model Keras .h5 (sama seperti sebelumnya di app_v3.py)
+def load_keras_model(model_path):
+    from tensorflow.keras.models import load_model
+    from tensorflow.keras.metrics import MeanAbsoluteError
+    return load_model(model_path, custom_objects={'mae': MeanAbsoluteError()})
+
+
+# Fungsi untuk memastikan nama backend dikenal, dari environment maupun sensors.json
+def check_backend_name(sensor, backend):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}' for {sensor}. Use one of: {', '.join(BACKENDS)}")
+    return backend
+
+
+# Fungsi untuk menentukan backend per sensor dari environment
+# Contoh: INFERENCE_BACKEND_CONDUCTIVITY=tflite_int8, atau INFERENCE_BACKEND=tflite_fp16 untuk semua sensor
+def get_backend_name(sensor):
+    backend = os.getenv(f'INFERENCE_BACKEND_{sensor.upper()}') or os.getenv('INFERENCE_BACKEND', DEFAULT_BACKEND)
+    return check_backend_name(sensor, backend)
+
+
+# Fungsi untuk menentukan path file .tflite hasil konversi, contoh: model.h5 -> model.int8.tflite
+def tflite_path(model_path, backend):
+    suffix = backend.split('_', 1)[1]
+    return f'{os.path.splitext(model_path)[0]}.{suffix}.tflite'
+
+
+# Fungsi untuk mengonversi model .h5 menjadi TFLite (float16 atau dynamic-range int8)
+def convert_to_tflite(model_path, backend, output_path=None):
+    import tensorflow as tf
+
+    if backend not in ('tflite_fp16', 'tflite_int8'):
+        raise ValueError(f"Backend '{backend}' is not a TFLite backend")
+
+    model = load_keras_model(model_path)
+
+    # from_keras_model membekukan bobot menjadi konstanta dan mempertahankan batch dinamis dari input model.
+    # Konversi lewat tf.function menyisakan READ_VARIABLE yang gagal saat invoke di Keras 3
+    converter = tf.lite.TFLiteConverter.from_keras_model(model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if backend == 'tflite_fp16':
+        converter.target_spec.supported_types = [tf.float16]
+    # Tanpa representative dataset, Optimize.DEFAULT menghasilkan kuantisasi dynamic-range int8
+
+    # Layer LSTM membutuhkan TF ops untuk tensor list ketika batch dinamis
+    converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS, tf.lite.OpsSet.SELECT_TF_OPS]
+    converter._experimental_lower_tensor_list_ops = False
+
+    tflite_model = converter.convert()
+
+    # Ditulis ke file sementara lalu dipindahkan, supaya proses lain (worker gunicorn yang mengonversi
+    # bersamaan) tidak pernah membaca file yang belum selesai ditulis
+    output_path = output_path or tflite_path(model_path, backend)
+    tmp_path = f'{output_path}.{os.getpid()}.tmp'
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(tflite_model)
+        os.replace(tmp_path, output_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return output_path
+
+
+# Objek runtime TF (model Keras, interpreter TFLite) dibuat per proses saat pertama dipakai, tidak saat dimuat.
+# Dengan begitu proses master gunicorn bisa memuat aplikasi dan file model sebelum fork tanpa pernah
+# menjalankan runtime TF, yang tidak aman dipakai lagi di proses anak setelah fork
+class LazyBackend:
+    def __init__(self, name):
+        self.name = name
+        self._runtime = None
+        self._pid = None
+        self._load_lock = threading.Lock()
+
+    def runtime(self):
+        if self._pid != os.getpid():
+            with self._load_lock:
+                if self._pid != os.getpid():
+                    self._runtime = self.build()
+                    self._pid = os.getpid()
+        return self._runtime
+
+    def build(self):
+        raise NotImplementedError
+
+
+# Backend referensi: model Keras float32
+class KerasBackend(LazyBackend):
+    def __init__(self, model_path):
+        super().__init__('keras')
+        self.model_path = model_path
+
+    def build(self):
+        return load_keras_model(self.model_path)
+
+    def predict(self, X):
+        return self.runtime().predict(X, verbose=0)
+
+
+# Backend ringan: interpreter TFLite (fp16/int8). Isi file model (bytes) dibaca sekali dan
+# dipakai bersama oleh worker setelah fork; interpreter dibuat di setiap proses
+class TFLiteBackend(LazyBackend):
+    def __init__(self, model_content, name, num_threads=None):
+        super().__init__(name)
+        self.model_content = model_content
+        self.num_threads = num_threads
+        self._input_shape = None
+        # Interpreter TFLite tidak thread-safe, sedangkan Flask melayani request di banyak thread
+        self._lock = threading.Lock()
+
+    def build(self):
+        import tensorflow as tf
+
+        interpreter = tf.lite.Interpreter(model_content=self.model_content, num_threads=self.num_threads)
+        self.input_index = interpreter.get_input_details()[0]['index']
+        self.output_index = interpreter.get_output_details()[0]['index']
+        self._input_shape = None
+        return interpreter
+
+    def predict(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        if len(X) == 0:
+            return np.empty_like(X)
+        interpreter = self.runtime()
+        with self._lock:
+            # Alokasi ulang tensor hanya jika ukuran batch berubah
+            if self._input_shape != X.shape:
+                interpreter.resize_tensor_input(self.input_index, X.shape)
+                interpreter.allocate_tensors()
+                self._input_shape = X.shape
+            interpreter.set_tensor(self.input_index, X)
+            interpreter.invoke()
+            return interpreter.get_tensor(self.output_index).copy()
+
+
+# Fungsi untuk memuat model sensor sesuai backend yang dipilih (lewat argumen atau environment)
+def load_sensor_model(sensor, model_path, backend=None):
+    backend = check_backend_name(sensor, backend) if backend else get_backend_name(sensor)
+
+    if backend == 'keras':
+        return KerasBackend(model_path)
+
+    # Konversi otomatis jika file .tflite belum ada
+    path = tflite_path(model_path, backend)
+    if not os.path.exists(path):
+        convert_to_tflite(model_path, backend, path)
+    with open(path, 'rb') as f:
+        model_content = f.read()
+
+    num_threads = os.getenv('TFLITE_NUM_THREADS')
+    return TFLiteBackend(model_content, backend, int(num_threads) if num_threads else None)
+
+
+# Konversi manual semua model di sensors.json, contoh: python inference.py tflite_int8
+if __name__ == '__main__':
+    import sys
+    from pipeline import load_sensor_specs
+
+    for backend in sys.argv[1:] or ['tflite_fp16', 'tflite_int8']:
+        for sensor, spec in load_sensor_specs().items():
+            print(f'{sensor} ({backend}): {convert_to_tflite(spec.model_path, backend)}')
@@ -0,0 +1,404 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+import pandas as pd
+import requests
+from dotenv import load_dotenv
+from requests.auth import HTTPBasicAuth
+
+from inference import check_backend_name, load_sensor_model
+from resample import check_resample_config, gap_free_windows, resample_series
+from sampling import coverage, densify_indices, sampling_stride, sliding_windows
+
+load_dotenv()
+
+SENSORS_CONFIG = os.getenv('SENSORS_CONFIG', 'sensors.json')
+DEFAULT_DEVICE = os.getenv('DEFAULT_DEVICE', 'AI349454596D98')
+
+STAGES = ('fetch', 'parse', 'resample', 'window', 'infer', 'rule', 'serialize')
+TIME_FORMATS = ('iso', 'epoch')
+
+
+# Konfigurasi satu sensor: lokasi model, panjang window, aturan anomali, dan resampling (opsional)
+class SensorSpec:
+    def __init__(self, name, model_path, time_steps=30, loss_threshold=None, value_min=None, value_max=None,
+                 backend=None, resample=None):
+        self.name = name
+        self.model_path = model_path
+        self.time_steps = time_steps
+        self.loss_threshold = loss_threshold
+        self.value_min = value_min
+        self.value_max = value_max
+        # None: backend dipilih lewat INFERENCE_BACKEND_<SENSOR>
+        self.backend = check_backend_name(name, backend) if backend else None
+        # None: tanpa resampling, atau {"cadence_seconds": ..., "gap_fill": ..., "max_gap_seconds": ...}
+        self.resample = check_resample_config(name, resample)
+
+    @classmethod
+    def from_dict(cls, name, config):
+        return cls(name, **config)
+
+
+# Fungsi untuk membaca daftar sensor dari file konfigurasi JSON (default: sensors.json)
+def load_sensor_specs(path=None):
+    with open(path or SENSORS_CONFIG) as f:
+        config = json.load(f)
+    return {name: SensorSpec.from_dict(name, sensor_config) for name, sensor_config in config.items()}
+
+
+# Fungsi untuk membaca tanggal dari request: DDMMYYYY (awal hari) atau datetime ISO 8601 lengkap
+# seperti 2024-08-06T06:30:00Z untuk query di bawah satu hari. Tanpa zona waktu dianggap UTC
+def parse_request_datetime(date_str):
+    try:
+        return datetime.strptime(date_str, "%d%m%Y").replace(tzinfo=timezone.utc)
+    except ValueError:
+        pass
+    parsed = datetime.fromisoformat(date_str)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.astimezone(timezone.utc)
+
+
+# Fungsi untuk konversi format tanggal request menjadi format ISO yang dibutuhkan API eksternal
+def convert_date_format(date_str):
+    # Mengubah DDMMYYYY atau ISO 8601 menjadi format YYYY-MM-DDTHH:MM:SSZ
+    return parse_request_datetime(date_str).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# Fungsi untuk mengubah kolom waktu (string ISO atau angka epoch ms) menjadi array epoch ms int64, sekali dan tervektorisasi
+def to_epoch_ms(times):
+    times = pd.Series(times)
+    if pd.api.types.is_numeric_dtype(times):
+        # NaN tidak boleh diubah diam-diam menjadi int64 (hasilnya INT64_MIN)
+        if times.isna().any():
+            raise ValueError('Missing or invalid time values')
+        return times.to_numpy(dtype=np.int64)
+    parsed = pd.to_datetime(times, utc=True, format='ISO8601').dt.tz_convert(None)
+    if parsed.isna().any():
+        raise ValueError('Missing or invalid time values')
+    return parsed.to_numpy().astype('datetime64[ms]').astype(np.int64)
+
+
+# Fungsi untuk mengubah array epoch ms kembali menjadi string ISO (hanya dipanggil saat serialisasi)
+def format_epoch_ms(epoch_ms):
+    epoch_ms = np.asarray(epoch_ms, dtype=np.int64)
+    # Tanpa milidetik jika semua waktu tepat di detik, contoh: 2024-08-06T00:00:00Z
+    unit = 's' if np.all(epoch_ms % 1000 == 0) else 'ms'
+    return np.char.add(np.datetime_as_string(epoch_ms.astype('datetime64[ms]'), unit=unit), 'Z').tolist()
+
+
+# Fungsi untuk memotong deret ke rentang [start, end] dengan binary search pada kolom epoch yang terurut
+def slice_time_range(frame, start_date_iso=None, end_date_iso=None):
+    epoch = frame['time'].to_numpy()
+    if len(epoch) == 0 or np.any(epoch[1:] < epoch[:-1]):
+        return frame
+    start = np.searchsorted(epoch, to_epoch_ms([start_date_iso])[0], 'left') if start_date_iso else 0
+    end = np.searchsorted(epoch, to_epoch_ms([end_date_iso])[0], 'right') if end_date_iso else len(epoch)
+    if start == 0 and end == len(epoch):
+        return frame
+    return frame.iloc[start:end].reset_index(drop=True)
+
+
+# Error ketika data tidak bisa diambil dari API eksternal
+class ExternalAPIError(Exception):
+    def __init__(self, message, status_code=None):
+        super().__init__(message)
+        self.status_code = status_code
+
+    def to_dict(self):
+        error = {'error': str(self)}
+        if self.status_code is not None:
+            error['status_code'] = self.status_code
+        return error
+
+
+# Stage fetch: mengambil data telemetry mentah dari API eksternal (satu panggilan berisi semua sensor)
+def fetch_external(start_date_iso, end_date_iso, device=DEFAULT_DEVICE):
+    # URL dan parameter API untuk mengambil data
+    url = os.getenv('EXTERNAL_API_URL')
+    params = {
+        "start": start_date_iso,  # Tanggal mulai dalam format ISO
+        "end": end_date_iso,  # Tanggal akhir dalam format ISO
+        "device": device
+    }
+
+    # Basic authentication
+    username = os.getenv('EXTERNAL_API_USERNAME')
+    password = os.getenv('EXTERNAL_API_PASSWORD')
+
+    response = requests.get(url, params=params, auth=HTTPBasicAuth(username, password))
+    if response.status_code != 200:
+        raise ExternalAPIError('Failed to retrieve data from external API', response.status_code)
+    return response.json()
+
+
+# Stage parse: mengambil deret satu sensor dari data mentah menjadi DataFrame dengan kolom
+# time (epoch ms int64) dan value
+def parse_records(payload, sensor):
+    if sensor not in payload:
+        raise ExternalAPIError(f'{sensor.capitalize()} data not found in the response')
+    frame = pd.DataFrame(payload[sensor], columns=['time', 'value'])
+    frame['time'] = to_epoch_ms(frame['time'])
+    return frame
+
+
+# Stage infer: prediksi model dan MAE loss per window
+def infer_losses(model, windows):
+    if len(windows) == 0:
+        return np.empty((0,) + windows.shape[1:] + (1,)), np.empty(0)
+    X = windows[:, :, np.newaxis]
+    X_pred = model.predict(X)
+    return X_pred, np.mean(np.abs(X_pred - X), axis=1)[:, 0]
+
+
+# Stage rule: aturan anomali
+# Rule 1: loss > threshold, Rule 2: value < value_min, Rule 3: value > value_max
+# Nilai yang dicek adalah nilai pada posisi awal window (sama seperti detect_anomaly_* sebelumnya)
+def apply_rules(spec, mae_loss, value):
+    return loss_over_threshold(spec, mae_loss) | value_out_of_range(spec, value)
+
+
+# Aturan loss: MAE loss di atas loss_threshold
+def loss_over_threshold(spec, mae_loss):
+    if spec.loss_threshold is None:
+        return np.zeros(len(mae_loss), dtype=bool)
+    return mae_loss > spec.loss_threshold
+
+
+# Aturan rentang nilai: nilai sensor di luar value_min/value_max
+def value_out_of_range(spec, value):
+    value = np.asarray(value)
+    anomaly = np.zeros(value.shape, dtype=bool)
+    if spec.value_min is not None:
+        anomaly |= value < spec.value_min
+    if spec.value_max is not None:
+        anomaly |= value > spec.value_max
+    return anomaly
+
+
+# Fungsi untuk mengubah nilai menjadi list JSON, NaN (gap hasil resampling) menjadi null
+def serialize_values(values):
+    if not values.isna().any():
+        return values.tolist()
+    return values.astype(object).where(values.notna(), None).tolist()
+
+
+# Stage serialize: membentuk response JSON dengan format yang sama untuk semua sensor
+# time_format: 'iso' (string ISO 8601) atau 'epoch' (epoch ms)
+def serialize_result(spec, frame, indices, mae_loss, anomaly, window_coverage, predictions=None, time_format='iso'):
+    sensor = spec.name
+    # Hanya waktu window yang dikembalikan yang diformat
+    window_time = frame['time'].to_numpy()[indices + spec.time_steps]
+    result = {
+        f'{sensor}_mae_loss': mae_loss.tolist(),
+        f'{sensor}_time': format_epoch_ms(window_time) if time_format == 'iso' else window_time.tolist(),
+        f'{sensor}_value': serialize_values(frame['value']),  # Nilai sensor (null untuk gap yang tidak diisi)
+        f'{sensor}_anomaly': anomaly.tolist(),  # Status anomali (True/False)
+        'coverage': window_coverage
+    }
+    if window_coverage['windows_scored'] < window_coverage['windows_total']:
+        result[f'{sensor}_window_index'] = indices.tolist()  # Posisi window yang dinilai
+    if predictions is not None:
+        result[f'{sensor}_prediction'] = predictions.tolist()
+    return result
+
+
+# Statistik durasi per stage (per proses) untuk benchmark
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.seconds = 0.0
+        self._lock = threading.Lock()
+
+    def add(self, seconds):
+        with self._lock:
+            self.calls += 1
+            self.seconds += seconds
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                'calls': self.calls,
+                'total_seconds': round(self.seconds, 4),
+                'avg_seconds': round(self.seconds / self.calls, 6) if self.calls else 0.0,
+            }
+
+
+# Pipeline scoring: fetch -> parse -> resample -> window -> infer -> rule -> serialize
+# Setiap stage bisa diganti lewat argumen constructor, dengan signature yang sama seperti fungsi default
+class ScoringPipeline:
+    def __init__(self, specs, fetch=fetch_external, parse=parse_records, resample=resample_series,
+                 window=sliding_windows, infer=infer_losses, rule=apply_rules, serialize=serialize_result):
+        self.specs = specs
+        self.stages = {
+            'fetch': fetch,
+            'parse': parse,
+            'resample': resample,
+            'window': window,
+            'infer': infer,
+            'rule': rule,
+            'serialize': serialize,
+        }
+        self.stats = {stage: StageStats() for stage in STAGES}
+        self.models = {}
+        self._models_lock = threading.Lock()
+
+    # Menjalankan satu stage sambil mencatat durasinya
+    def _stage(self, name, *args):
+        start = time.perf_counter()
+        try:
+            return self.stages[name](*args)
+        finally:
+            self.stats[name].add(time.perf_counter() - start)
+
+    def spec(self, sensor):
+        if sensor not in self.specs:
+            raise KeyError(f"Unknown sensor '{sensor}'")
+        return self.specs[sensor]
+
+    # Model dimuat sekali per sensor (saat pertama dipakai, atau lewat load_models)
+    def model(self, sensor):
+        model = self.models.get(sensor)
+        if model is None:
+            with self._models_lock:
+                model = self.models.get(sensor)
+                if model is None:
+                    spec = self.spec(sensor)
+                    model = self.models[sensor] = load_sensor_model(sensor, spec.model_path, spec.backend)
+        return model
+
+    def load_models(self):
+        for sensor in self.specs:
+            self.model(sensor)
+
+    # Memanaskan semua model dengan batch kecil supaya request pertama tidak menanggung biaya inisialisasi
+    def warm_up(self, windows=8):
+        for sensor, spec in self.specs.items():
+            self.model(sensor).predict(np.zeros((windows, spec.time_steps, 1), dtype=np.float32))
+
+    # Menilai window yang sudah jadi (dipakai streaming): mengembalikan (loss, anomali menurut threshold loss).
+    # Aturan rentang nilai diperiksa streaming langsung pada titik baru saat ingest
+    def score_windows(self, sensor, windows):
+        spec = self.spec(sensor)
+        _, mae_loss = self._stage('infer', self.model(sensor), windows)
+        return mae_loss, loss_over_threshold(spec, mae_loss)
+
+    # Menilai satu deret yang sudah di-parse. stride > 1 atau budget mengaktifkan mode sampling
+    def score(self, sensor, frame, stride=1, budget=None, include_prediction=False, time_format='iso'):
+        spec = self.spec(sensor)
+        model = self.model(sensor)
+
+        frame = self._stage('resample', frame, spec)
+        values = frame['value'].to_numpy(dtype=np.float64)
+        windows = self._stage('window', values, spec.time_steps)
+        n_windows = len(windows)
+
+        # Window yang melewati gap (berisi NaN) tidak dikirim ke model
+        valid = gap_free_windows(values, spec.time_steps)
+        skipped_gap = int(n_windows - valid.sum())
+
+        # Pass kasar: setiap window ke-k (k = 1 berarti semua window)
+        stride = sampling_stride(n_windows - skipped_gap, stride, budget)
+        indices = np.arange(0, n_windows, stride)
+        indices = indices[valid[indices]]
+        predictions, mae_loss = self._stage('infer', model, windows[indices])
+
+        # Pass adaptif: tambahkan tetangga window yang mendekati threshold selama budget masih ada
+        if budget and spec.loss_threshold is not None:
+            extra = densify_indices(indices, mae_loss, spec.loss_threshold, stride, n_windows,
+                                    budget - len(indices), valid)
+            if len(extra):
+                extra_predictions, extra_loss = self._stage('infer', model, windows[extra])
+                indices = np.concatenate((indices, extra))
+                mae_loss = np.concatenate((mae_loss, extra_loss))
+                predictions = np.concatenate((predictions, extra_predictions))
+                order = np.argsort(indices)
+                indices, mae_loss, predictions = indices[order], mae_loss[order], predictions[order]
+
+        anomaly = self._stage('rule', spec, mae_loss, values[indices])
+        window_coverage = coverage(n_windows, len(indices), stride, budget, skipped_gap)
+        return self._stage('serialize', spec, frame, indices, mae_loss, anomaly, window_coverage,
+                           predictions if include_prediction else None, time_format)
+
+    # Mengambil data dari API eksternal lalu menilai satu sensor
+    def run(self, sensor, start_date_iso, end_date_iso, device=DEFAULT_DEVICE, stride=1, budget=None,
+            include_prediction=False, time_format='iso'):
+        self.spec(sensor)
+        payload = self._stage('fetch', start_date_iso, end_date_iso, device)
+        frame = slice_time_range(self._stage('parse', payload, sensor), start_date_iso, end_date_iso)
+        return self.score(sensor, frame, stride, budget, include_prediction, time_format)
+
+    # Bulk API: items berisi (sensor, frame). Window dari semua item dengan sensor yang sama
+    # diprediksi dalam satu panggilan model, hasil dikembalikan dengan urutan yang sama seperti items
+    def score_bulk(self, items, include_prediction=False, time_format='iso'):
+        results = [None] * len(items)
+        for sensor in {sensor for sensor, _ in items}:
+            spec = self.spec(sensor)
+            positions = [i for i, (item_sensor, _) in enumerate(items) if item_sensor == sensor]
+
+            frames, values, windows, indices = [], [], [], []
+            for i in positions:
+                frame = self._stage('resample', items[i][1], spec)
+                frame_values = frame['value'].to_numpy(dtype=np.float64)
+                frame_windows = self._stage('window', frame_values, spec.time_steps)
+                # Hanya window yang tidak melewati gap yang dikirim ke model
+                frame_indices = np.flatnonzero(gap_free_windows(frame_values, spec.time_steps))
+                frames.append(frame)
+                values.append(frame_values)
+                windows.append(frame_windows)
+                indices.append(frame_indices)
+
+            predictions, mae_loss = self._stage(
+                'infer', self.model(sensor),
+                np.concatenate([frame_windows[frame_indices] for frame_windows, frame_indices in zip(windows, indices)]))
+
+            offset = 0
+            for i, frame, frame_values, frame_windows, frame_indices in zip(positions, frames, values, windows, indices):
+                n_windows, n_scored = len(frame_windows), len(frame_indices)
+                loss = mae_loss[offset:offset + n_scored]
+                anomaly = self._stage('rule', spec, loss, frame_values[frame_indices])
+                results[i] = self._stage('serialize', spec, frame, frame_indices, loss, anomaly,
+                                         coverage(n_windows, n_scored, skipped_gap=n_windows - n_scored),
+                                         predictions[offset:offset + n_scored] if include_prediction else None,
+                                         time_format)
+                offset += n_scored
+        return results
+
+    # Bulk API dari API eksternal: jobs berisi (device, sensor, start_iso, end_iso).
+    # Satu panggilan API eksternal dipakai untuk semua sensor pada device dan rentang yang sama
+    def run_bulk(self, jobs, include_prediction=False, time_format='iso'):
+        payloads = {}
+        items = []
+        for device, sensor, start_date_iso, end_date_iso in jobs:
+            self.spec(sensor)
+            key = (device, start_date_iso, end_date_iso)
+            if key not in payloads:
+                payloads[key] = self._stage('fetch', start_date_iso, end_date_iso, device)
+            frame = self._stage('parse', payloads[key], sensor)
+            items.append((sensor, slice_time_range(frame, start_date_iso, end_date_iso)))
+        return self.score_bulk(items, include_prediction, time_format)
+
+    def stage_metrics(self):
+        return {stage: stats.to_dict() for stage, stats in self.stats.items()}
+
+
+# Benchmark per stage dari file contoh (format sama dengan response API eksternal)
+# Contoh: python pipeline.py sample.json
+if __name__ == '__main__':
+    import sys
+
+    with open(sys.argv[1]) as f:
+        sample = json.load(f)
+    repeat = int(sys.argv[2]) if len(sys.argv) > 2 else 5
+
+    pipeline = ScoringPipeline(load_sensor_specs(), fetch=lambda start, end, device: sample)
+    pipeline.load_models()
+    sensors = [sensor for sensor in pipeline.specs if sensor in sample]
+    for _ in range(repeat):
+        for sensor in sensors:
+            pipeline.run(sensor, None, None)
+    print(json.dumps(pipeline.stage_metrics(), indent=2))
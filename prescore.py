@@ -0,0 +1,134 @@
+import logging
+import os
+import random
+import re
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from dotenv import load_dotenv
+
+from pipeline import DEFAULT_DEVICE
+
+load_dotenv()
+
+logger = logging.getLogger(__name__)
+
+# Preset dipisahkan koma, format [device/]sensor:range, contoh: conductivity:24h,salinity:7d,AI123/salinity:24h
+PRESETS = os.getenv('PRESCORE_PRESETS', '')
+INTERVAL = float(os.getenv('PRESCORE_INTERVAL', 300))
+JITTER = float(os.getenv('PRESCORE_JITTER', 30))
+MAX_CONCURRENCY = int(os.getenv('PRESCORE_MAX_CONCURRENCY', 2))
+# Hasil yang lebih tua dari batas ini tidak dipakai lagi (default: 3x interval)
+MAX_STALENESS = float(os.getenv('PRESCORE_MAX_STALENESS', 3 * INTERVAL))
+
+RANGE_UNITS = {'m': 'minutes', 'h': 'hours', 'd': 'days'}
+
+
+# Fungsi untuk mengubah rentang relatif seperti 30m, 24h atau 7d menjadi timedelta
+def parse_range(range_str):
+    match = re.fullmatch(r'(\d+)([mhd])', range_str or '')
+    if not match:
+        raise ValueError(f"Invalid range '{range_str}'. Use a number followed by m, h or d, e.g. 24h or 7d.")
+    return timedelta(**{RANGE_UNITS[match.group(2)]: int(match.group(1))})
+
+
+# Fungsi untuk menghitung waktu mulai dan akhir (format ISO untuk API eksternal) dari rentang relatif
+def range_to_iso(range_str, now=None):
+    end = now or datetime.now(timezone.utc)
+    start = end - parse_range(range_str)
+    return start.strftime("%Y-%m-%dT%H:%M:%SZ"), end.strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+# Fungsi untuk membaca daftar preset (device, sensor, range) dari konfigurasi.
+# Sensor yang tidak dikenal (salah ketik) ditolak saat start, bukan gagal di setiap putaran scheduler
+def parse_presets(presets_str, sensors=None, default_device=DEFAULT_DEVICE):
+    presets = []
+    for item in filter(None, (p.strip() for p in presets_str.split(','))):
+        target, _, range_str = item.partition(':')
+        device, _, sensor = target.rpartition('/')
+        if sensors is not None and sensor not in sensors:
+            raise ValueError(f"Unknown sensor '{sensor}' in PRESCORE_PRESETS item '{item}'. "
+                             f"Use one of: {', '.join(sorted(sensors))}")
+        parse_range(range_str)
+        presets.append((device or default_device, sensor, range_str))
+    return presets
+
+
+# Scheduler yang secara berkala mengambil dan menilai preset di background lalu menyimpan hasilnya di memori
+class PrescoreScheduler:
+    def __init__(self, presets, score_fn, interval=INTERVAL, jitter=JITTER,
+                 max_concurrency=MAX_CONCURRENCY, max_staleness=MAX_STALENESS):
+        # score_fn(device, sensor, start_iso, end_iso) -> hasil prediksi (dict)
+        self.presets = presets
+        self.score_fn = score_fn
+        self.interval = interval
+        self.jitter = jitter
+        self.max_staleness = max_staleness
+        self.results = {}
+        self.failures = 0
+        self._slots = threading.BoundedSemaphore(max_concurrency)
+        self._lock = threading.Lock()
+        self._running = set()
+        self._started_pid = None
+
+    # Dijalankan sekali per proses (di worker setelah fork, atau langsung saat development)
+    def start(self):
+        with self._lock:
+            if not self.presets or self._started_pid == os.getpid():
+                return
+            self._started_pid = os.getpid()
+        threading.Thread(target=self._run, name='prescore-scheduler', daemon=True).start()
+
+    def _run(self):
+        # Jadwal awal diacak supaya worker dan preset tidak menembak API eksternal bersamaan
+        next_run = {preset: time.monotonic() + random.uniform(0, self.jitter) for preset in self.presets}
+        while True:
+            preset, due = min(next_run.items(), key=lambda item: item[1])
+            delay = due - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+
+            next_run[preset] = time.monotonic() + self.interval + random.uniform(-self.jitter, self.jitter)
+            with self._lock:
+                if preset in self._running:
+                    # Putaran sebelumnya untuk preset ini belum selesai
+                    continue
+                self._running.add(preset)
+            # Batasi jumlah preset yang dinilai bersamaan
+            self._slots.acquire()
+            threading.Thread(target=self._refresh, args=(preset,), daemon=True).start()
+
+    def _refresh(self, preset):
+        device, sensor, range_str = preset
+        try:
+            start_iso, end_iso = range_to_iso(range_str)
+            result = self.score_fn(device, sensor, start_iso, end_iso)
+            with self._lock:
+                self.results[preset] = (result, time.time())
+        except Exception:
+            self.failures += 1
+            logger.exception('Failed to pre-score %s', preset)
+        finally:
+            self._slots.release()
+            with self._lock:
+                self._running.discard(preset)
+
+    # Mengembalikan (hasil, waktu_scoring) jika ada hasil yang masih cukup baru, atau None
+    def get(self, device, sensor, range_str):
+        with self._lock:
+            cached = self.results.get((device, sensor, range_str))
+        if cached is None or time.time() - cached[1] > self.max_staleness:
+            return None
+        return cached
+
+    def metrics(self):
+        now = time.time()
+        with self._lock:
+            return {
+                'presets': len(self.presets),
+                'running': len(self._running),
+                'failures': self.failures,
+                'staleness_seconds': {f'{d}/{s}:{r}': round(now - scored_at, 1)
+                                      for (d, s, r), (_, scored_at) in self.results.items()},
+            }
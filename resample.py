@@ -0,0 +1,88 @@
+import numpy as np
+import pandas as pd
+
+# Cara mengisi slot kosong yang gap-nya masih dalam batas toleransi
+GAP_FILLS = ('none', 'ffill', 'interpolate')
+RESAMPLE_KEYS = ('cadence_seconds', 'gap_fill', 'max_gap_seconds')
+
+
+# Fungsi untuk memeriksa blok "resample" di sensors.json saat spec dibuat, supaya kesalahan konfigurasi
+# menghentikan aplikasi saat start, bukan menjadi error 500 di request pertama
+def check_resample_config(sensor, config):
+    if config is None:
+        return None
+    if not isinstance(config, dict):
+        raise ValueError(f"resample for {sensor} must be an object")
+    unknown = set(config) - set(RESAMPLE_KEYS)
+    if unknown:
+        raise ValueError(f"Unknown resample keys for {sensor}: {', '.join(sorted(unknown))}")
+
+    cadence = config.get('cadence_seconds')
+    if isinstance(cadence, bool) or not isinstance(cadence, (int, float)) or int(cadence * 1000) < 1:
+        raise ValueError(f"resample.cadence_seconds for {sensor} must be a number of at least 0.001")
+    max_gap = config.get('max_gap_seconds', 0)
+    if isinstance(max_gap, bool) or not isinstance(max_gap, (int, float)) or max_gap < 0:
+        raise ValueError(f"resample.max_gap_seconds for {sensor} must be a number of at least 0")
+    gap_fill = config.get('gap_fill', 'none')
+    if gap_fill not in GAP_FILLS:
+        raise ValueError(f"Unknown gap_fill '{gap_fill}' for {sensor}. Use one of: {', '.join(GAP_FILLS)}")
+    return {'cadence_seconds': cadence, 'gap_fill': gap_fill, 'max_gap_seconds': max_gap}
+
+
+# Stage resample: menyelaraskan deret ke cadence tetap (contoh: 60 detik) dengan operasi numpy tervektorisasi
+# - beberapa titik dalam satu slot (burst) dirata-rata
+# - slot kosong dengan panjang gap <= max_gap_seconds diisi sesuai gap_fill
+# - gap yang lebih panjang diringkas menjadi satu slot NaN, sehingga window yang melewatinya dilewati
+#   (tidak dinilai model) dan ukuran grid tetap sebanding dengan jumlah titik, berapa pun rentang waktunya
+# Konfigurasi per sensor di sensors.json: "resample": {"cadence_seconds": 60, "gap_fill": "interpolate", "max_gap_seconds": 300}
+def resample_series(frame, spec):
+    config = spec.resample
+    if not config or len(frame) == 0:
+        return frame
+
+    # Konfigurasi sudah diperiksa check_resample_config saat spec dibuat
+    cadence = int(config['cadence_seconds'] * 1000)
+    gap_fill = config['gap_fill']
+    # Jumlah slot kosong berturut-turut yang masih boleh diisi
+    max_missing = int(config['max_gap_seconds'] * 1000 // cadence)
+
+    epoch = frame['time'].to_numpy(dtype=np.int64)
+    values = frame['value'].to_numpy(dtype=np.float64)
+    present = ~np.isnan(values)
+    epoch, values = epoch[present], values[present]
+    if len(epoch) == 0:
+        return frame
+
+    # Setiap titik masuk ke slot grid terdekat; titik paling awal selalu berada di slot 0
+    grid_index = np.rint(epoch / cadence).astype(np.int64)
+    first = grid_index.min()
+    occupied, inverse = np.unique(grid_index - first, return_inverse=True)
+    means = np.bincount(inverse, weights=values) / np.bincount(inverse)
+
+    # Jumlah slot kosong setelah setiap slot berisi, dan berapa yang disimpan di grid:
+    # semua untuk gap pendek, satu slot NaN untuk gap panjang
+    missing = np.append(np.diff(occupied) - 1, 0)
+    kept = np.where(missing <= max_missing, missing, 1)
+    segment = kept + 1
+    position = np.concatenate(([0], np.cumsum(segment)[:-1]))
+    n_slots = int(segment.sum())
+    slots = np.repeat(occupied, segment) + np.arange(n_slots) - np.repeat(position, segment)
+
+    grid = np.full(n_slots, np.nan)
+    grid[position] = means
+
+    if gap_fill != 'none' and max_missing > 0:
+        fillable = np.isnan(grid) & (np.repeat(missing, segment) <= max_missing)
+        if gap_fill == 'ffill':
+            grid[fillable] = np.repeat(means, segment)[fillable]
+        else:
+            grid[fillable] = np.interp(slots[fillable], occupied, means)
+
+    return pd.DataFrame({'time': (first + slots) * cadence, 'value': grid})
+
+
+# Fungsi untuk menandai window yang tidak melewati gap (tidak mengandung NaN), tanpa loop per window
+def gap_free_windows(values, time_steps=30):
+    n_windows = max(len(values) - time_steps, 0)
+    missing = np.concatenate(([0], np.cumsum(np.isnan(values))))
+    return (missing[time_steps:time_steps + n_windows] - missing[:n_windows]) == 0
@@ -0,0 +1,62 @@
+import math
+import os
+
+import numpy as np
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Window dengan loss >= DENSIFY_RATIO * threshold dianggap mendekati anomali dan tetangganya ikut dinilai
+DENSIFY_RATIO = float(os.getenv('SAMPLING_DENSIFY_RATIO', 0.8))
+
+
+# Fungsi untuk membuat semua window (tanpa menyalin data) dengan urutan yang sama seperti create_sequences:
+# window ke-i berisi values[i:i + time_steps]
+def sliding_windows(values, time_steps=30):
+    if len(values) <= time_steps:
+        return np.empty((0, time_steps), dtype=values.dtype)
+    return np.lib.stride_tricks.sliding_window_view(values, time_steps)[:-1]
+
+
+# Fungsi untuk menentukan stride efektif. Dengan budget, pass kasar memakai paling banyak setengah budget
+# sehingga setengah sisanya tersedia untuk memadatkan area di sekitar window yang mencurigakan
+def sampling_stride(n_windows, stride=1, budget=None):
+    if budget:
+        stride = max(stride, math.ceil(2 * n_windows / budget))
+    return max(stride, 1)
+
+
+# Fungsi untuk memilih window tambahan di sekitar window kasar yang loss-nya mendekati threshold,
+# dimulai dari loss terbesar, sampai budget habis. Window dengan valid[j] False (melewati gap) tidak dipilih
+def densify_indices(indices, losses, threshold, stride, n_windows, budget, valid=None):
+    if budget <= 0 or stride <= 1:
+        return np.empty(0, dtype=np.int64)
+
+    scored = set(indices.tolist())
+    extra = []
+    for i in np.argsort(-losses):
+        if losses[i] < DENSIFY_RATIO * threshold:
+            break
+        center = int(indices[i])
+        for j in range(max(center - stride + 1, 0), min(center + stride, n_windows)):
+            if j not in scored and (valid is None or valid[j]):
+                scored.add(j)
+                extra.append(j)
+                if len(extra) >= budget:
+                    return np.array(extra, dtype=np.int64)
+    return np.array(extra, dtype=np.int64)
+
+
+# Informasi cakupan scoring untuk response, supaya klien tahu apakah hasilnya perkiraan.
+# Window yang dilewati karena gap tidak dihitung sebagai perkiraan
+def coverage(n_windows, n_scored, stride=1, budget=None, skipped_gap=0):
+    n_scorable = n_windows - skipped_gap
+    return {
+        'windows_total': n_windows,
+        'windows_skipped_gap': skipped_gap,
+        'windows_scored': n_scored,
+        'ratio': round(n_scored / n_scorable, 4) if n_scorable else 1.0,
+        'stride': stride,
+        'budget': budget,
+        'approximate': n_scored < n_scorable,
+    }
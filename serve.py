@@ -0,0 +1,187 @@
+import gc
+import logging
+import os
+import signal
+import sys
+import threading
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+logger = logging.getLogger('serve')
+
+# Konfigurasi server produksi (bisa diatur lewat .env)
+BIND = os.getenv('BIND', '0.0.0.0:8000')
+CPU_COUNT = os.cpu_count() or 1
+WORKERS = int(os.getenv('WEB_CONCURRENCY', max(1, CPU_COUNT // 2)))
+WORKER_THREADS = int(os.getenv('WORKER_THREADS', 4))
+# Jumlah thread TF per worker dibagi rata supaya total thread tidak melebihi jumlah core
+TF_INTRA_OP_THREADS = int(os.getenv('TF_INTRA_OP_THREADS', max(1, CPU_COUNT // WORKERS)))
+TF_INTER_OP_THREADS = int(os.getenv('TF_INTER_OP_THREADS', 1))
+GRACEFUL_TIMEOUT = int(os.getenv('GRACEFUL_TIMEOUT', 30))
+TIMEOUT = int(os.getenv('WORKER_TIMEOUT', 120))
+WARMUP_WINDOWS = 8
+# Batas waktu warm-up per worker. Jika terlewati, TF kemungkinan macet setelah fork dan server dihentikan
+WARMUP_TIMEOUT = float(os.getenv('WARMUP_TIMEOUT', 60))
+# Memuat TF, aplikasi, dan file model di master sebelum fork. Runtime TF (model Keras, interpreter TFLite)
+# tetap dibuat di setiap worker setelah fork, lihat inference.LazyBackend
+PRELOAD_MODELS = os.getenv('PRELOAD_MODELS', 'true').lower() in ('1', 'true', 'yes')
+
+# Batasi thread pool native (OpenMP/MKL/TFLite) sebelum TensorFlow di-import
+os.environ.setdefault('OMP_NUM_THREADS', str(TF_INTRA_OP_THREADS))
+os.environ.setdefault('TF_NUM_INTRAOP_THREADS', str(TF_INTRA_OP_THREADS))
+os.environ.setdefault('TF_NUM_INTEROP_THREADS', str(TF_INTER_OP_THREADS))
+os.environ.setdefault('TFLITE_NUM_THREADS', str(TF_INTRA_OP_THREADS))
+
+
+# Fungsi untuk membaca pemakaian memori proses dari /proc (Linux), dalam MB
+# Rss = total memori yang terpetakan, Pss = bagian proporsional memori bersama, Private = memori milik proses sendiri
+def memory_usage(pid='self'):
+    usage = {}
+    try:
+        with open(f'/proc/{pid}/smaps_rollup') as f:
+            for line in f:
+                key, _, rest = line.partition(':')
+                if key in ('Rss', 'Pss', 'Shared_Clean', 'Shared_Dirty', 'Private_Clean', 'Private_Dirty'):
+                    usage[key] = int(rest.split()[0]) / 1024
+    except OSError:
+        return {}
+    return {
+        'rss_mb': round(usage.get('Rss', 0), 1),
+        'pss_mb': round(usage.get('Pss', 0), 1),
+        'shared_mb': round(usage.get('Shared_Clean', 0) + usage.get('Shared_Dirty', 0), 1),
+        'private_mb': round(usage.get('Private_Clean', 0) + usage.get('Private_Dirty', 0), 1),
+    }
+
+
+# Fungsi untuk memastikan endpoint prediksi dan stream SSE tidak bisa memakai semua thread worker.
+# Request yang berjalan, yang menunggu di antrian admission, dan stream yang terbuka sama-sama memegang thread
+def check_admission_limits():
+    from admission import MAX_ADMITTED, MAX_STREAMS
+
+    if WORKER_THREADS < 2 or MAX_ADMITTED + MAX_STREAMS > WORKER_THREADS - 1:
+        raise SystemExit(f'ADMISSION_MAX_ADMITTED ({MAX_ADMITTED}) + STREAM_MAX_SUBSCRIBERS ({MAX_STREAMS}) '
+                         f'must be at most WORKER_THREADS - 1 ({WORKER_THREADS - 1}), so that /health '
+                         f'and /auth/login always have a free thread.')
+
+
+# Fungsi untuk mengonversi model TFLite yang belum ada di proses terpisah (spawn), supaya runtime TF
+# yang dijalankan konverter tidak pernah ada di proses master yang akan di-fork
+def convert_missing_models():
+    from multiprocessing import get_context
+
+    from inference import convert_to_tflite, get_backend_name, tflite_path
+    from pipeline import load_sensor_specs
+
+    for sensor, spec in load_sensor_specs().items():
+        backend = spec.backend or get_backend_name(sensor)
+        if backend == 'keras' or os.path.exists(tflite_path(spec.model_path, backend)):
+            continue
+        logger.info('Converting %s model to %s', sensor, backend)
+        process = get_context('spawn').Process(target=convert_to_tflite, args=(spec.model_path, backend))
+        process.start()
+        process.join()
+        if process.exitcode != 0:
+            raise SystemExit(f'Converting the {sensor} model to {backend} failed')
+
+
+# Fungsi untuk memuat TensorFlow, aplikasi Flask, dan file model (di master jika PRELOAD_MODELS, selain itu di worker)
+def load_application():
+    import tensorflow as tf
+
+    # Harus dipanggil sebelum runtime TF diinisialisasi (sebelum model pertama dipakai)
+    tf.config.threading.set_intra_op_parallelism_threads(TF_INTRA_OP_THREADS)
+    tf.config.threading.set_inter_op_parallelism_threads(TF_INTER_OP_THREADS)
+
+    import app_v3
+    return app_v3
+
+
+# Fungsi untuk menjalankan warm-up dengan batas waktu. Mengembalikan False jika warm-up tidak selesai
+def warm_up_with_timeout(app_module, timeout=WARMUP_TIMEOUT):
+    thread = threading.Thread(target=app_module.pipeline.warm_up, args=(WARMUP_WINDOWS,), daemon=True)
+    thread.start()
+    thread.join(timeout)
+    return not thread.is_alive()
+
+
+def create_server(app_module=None):
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.arbiter import Arbiter
+
+    # Modul aplikasi: sudah ada jika dimuat di master, selain itu dimuat oleh setiap worker di load()
+    loaded = {'app_module': app_module}
+
+    class ProductionServer(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', BIND)
+            self.cfg.set('workers', WORKERS)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', WORKER_THREADS)
+            self.cfg.set('timeout', TIMEOUT)
+            self.cfg.set('graceful_timeout', GRACEFUL_TIMEOUT)
+            # Jika aplikasi sudah dimuat di master, worker mewarisinya lewat fork (copy-on-write)
+            self.cfg.set('preload_app', app_module is not None)
+            self.cfg.set('pre_fork', pre_fork)
+            self.cfg.set('post_fork', post_fork)
+            self.cfg.set('post_worker_init', post_worker_init)
+            self.cfg.set('worker_exit', worker_exit)
+
+        def load(self):
+            if loaded['app_module'] is None:
+                loaded['app_module'] = load_application()
+            return loaded['app_module'].app
+
+    def pre_fork(server, worker):
+        # Pindahkan objek yang sudah ada ke generasi permanen supaya GC di worker
+        # tidak menulis ulang halaman memori bersama (memecah copy-on-write)
+        gc.freeze()
+
+    def post_fork(server, worker):
+        if app_module is None:
+            return
+        # Koneksi database dari master tidak boleh dipakai bersama antar proses
+        with app_module.app.app_context():
+            app_module.db.engine.dispose(close=False)
+
+    def post_worker_init(worker):
+        module = loaded['app_module']
+        # Memanaskan model di worker agar request pertama tidak menanggung biaya inisialisasi
+        if not warm_up_with_timeout(module):
+            worker.log.error('Worker %s warm-up did not finish within %ss. TensorFlow may have deadlocked '
+                             'after fork; check that nothing runs a model in the master, or set '
+                             'PRELOAD_MODELS=false.', worker.pid, WARMUP_TIMEOUT)
+            # Kode keluar ini membuat gunicorn berhenti, bukan terus-menerus membuat worker baru yang macet
+            sys.exit(Arbiter.WORKER_BOOT_ERROR)
+        # Mulai pre-scoring sebelum request pertama supaya cache langsung terisi
+        module.prescore_scheduler.start()
+
+        # Stream SSE tidak pernah selesai sendiri. Saat SIGTERM, tutup semua stream lalu lanjutkan
+        # ke handler gunicorn, supaya request lain bisa selesai dalam GRACEFUL_TIMEOUT
+        stop_worker = signal.getsignal(signal.SIGTERM)
+
+        def handle_term(signum, frame):
+            module.stream_scorer.close()
+            stop_worker(signum, frame)
+
+        signal.signal(signal.SIGTERM, handle_term)
+        worker.log.info('Worker %s ready, memory: %s', worker.pid, memory_usage())
+
+    def worker_exit(server, worker):
+        worker.log.info('Worker %s stopped', worker.pid)
+
+    return ProductionServer()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    check_admission_limits()
+    app_module = None
+    if PRELOAD_MODELS:
+        convert_missing_models()
+        app_module = load_application()
+        logger.info('Master loaded models, memory: %s', memory_usage())
+    logger.info('Starting %d workers x %d threads, TF intra-op threads per worker: %d',
+                WORKERS, WORKER_THREADS, TF_INTRA_OP_THREADS)
+    create_server(app_module).run()
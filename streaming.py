@@ -0,0 +1,220 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+
+import numpy as np
+from dotenv import load_dotenv
+
+from pipeline import value_out_of_range
+
+load_dotenv()
+
+# Waktu maksimum (detik) untuk mengumpulkan window dari banyak device sebelum diprediksi sekaligus
+BATCH_INTERVAL = float(os.getenv('STREAM_BATCH_INTERVAL', 0.01))
+MAX_BATCH = int(os.getenv('STREAM_MAX_BATCH', 512))
+# Jumlah event yang boleh tertunda per subscriber sebelum event baru dibuang
+SUBSCRIBER_QUEUE = int(os.getenv('STREAM_SUBSCRIBER_QUEUE', 1000))
+# Setiap stream SSE memegang satu thread request selama terbuka, jadi jumlahnya dibatasi per worker.
+# Batas ini ikut dihitung dalam pembagian thread di admission.py dan diperiksa serve.py saat start
+MAX_SUBSCRIBERS = int(os.getenv('STREAM_MAX_SUBSCRIBERS', 1))
+RETRY_AFTER = int(os.getenv('STREAM_RETRY_AFTER', 30))
+HEARTBEAT_INTERVAL = 15
+# Penanda di antrian subscriber bahwa worker berhenti dan stream harus ditutup
+CLOSED = None
+
+logger = logging.getLogger(__name__)
+
+
+# Buffer melingkar berukuran tetap untuk nilai terakhir satu device dan sensor
+class RingBuffer:
+    def __init__(self, size):
+        self.size = size
+        self.values = np.zeros(size, dtype=np.float32)
+        self.count = 0
+        self.pos = 0
+
+    def full(self):
+        return self.count >= self.size
+
+    # Salinan isi buffer, urut dari nilai terlama ke terbaru
+    def window(self):
+        return np.concatenate((self.values[self.pos:], self.values[:self.pos]))
+
+    def push(self, value):
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.size
+        self.count = min(self.count + 1, self.size)
+
+
+# Scoring real-time: menyimpan ring buffer per (device, sensor), memprediksi window yang sudah lengkap
+# secara batch lintas device, dan mengirim event anomali ke semua subscriber
+class StreamScorer:
+    def __init__(self, pipeline, max_subscribers=MAX_SUBSCRIBERS):
+        self.pipeline = pipeline
+        self.max_subscribers = max_subscribers
+        self.buffers = {}
+        self.pending = queue.Queue()
+        self.subscribers = []
+        self.scored = 0
+        self.anomalies = 0
+        self.dropped_events = 0
+        self.rejected_subscribers = 0
+        self.closed = False
+        self._lock = threading.Lock()
+        self._worker_pid = None
+
+    # Thread scoring dijalankan saat data pertama masuk (setelah fork worker), bukan saat import
+    def _ensure_worker(self):
+        with self._lock:
+            if self._worker_pid != os.getpid():
+                self._worker_pid = os.getpid()
+                threading.Thread(target=self._run, name='stream-scorer', daemon=True).start()
+
+    # Menambahkan satu titik data. Window 30 nilai sebelumnya dinilai dengan waktu titik baru,
+    # sama seperti create_sequences pada endpoint prediksi. Aturan rentang nilai diperiksa langsung
+    # pada titik baru, tanpa menunggu model maupun 30 titik berikutnya
+    def ingest(self, device, sensor, time_value, value):
+        if sensor not in self.pipeline.specs:
+            raise ValueError(f"Unknown sensor '{sensor}'")
+        value = float(value)
+
+        if value_out_of_range(self.pipeline.specs[sensor], value):
+            self.anomalies += 1
+            self.publish({
+                'device': device,
+                'sensor': sensor,
+                'time': time_value,
+                'value': value,
+                'rule': 'value_range',
+                'anomaly': True,
+            })
+
+        with self._lock:
+            buffer = self.buffers.get((device, sensor))
+            if buffer is None:
+                buffer = self.buffers[(device, sensor)] = RingBuffer(self.pipeline.specs[sensor].time_steps)
+            window = buffer.window() if buffer.full() else None
+            buffer.push(value)
+
+        if window is None:
+            return False
+        self._ensure_worker()
+        self.pending.put((device, sensor, time_value, value, window))
+        return True
+
+    def _next_batch(self):
+        batch = [self.pending.get()]
+        deadline = time.monotonic() + BATCH_INTERVAL
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self.pending.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._next_batch()
+            for sensor in {item[1] for item in batch}:
+                items = [item for item in batch if item[1] == sensor]
+                try:
+                    self._score(sensor, items)
+                except Exception:
+                    # Kegagalan satu batch tidak boleh menghentikan thread scoring
+                    logger.exception('Failed to score %d %s windows', len(items), sensor)
+
+    def _score(self, sensor, items):
+        # Hanya aturan loss; aturan rentang nilai sudah diperiksa saat ingest
+        mae_loss, anomaly = self.pipeline.score_windows(sensor, np.stack([item[4] for item in items]))
+
+        self.scored += len(items)
+        # Event berisi waktu dan nilai titik baru yang memicu scoring window
+        for (device, _, time_value, value, _), loss, is_anomaly in zip(items, mae_loss, anomaly):
+            if is_anomaly:
+                self.anomalies += 1
+                self.publish({
+                    'device': device,
+                    'sensor': sensor,
+                    'time': time_value,
+                    'value': value,
+                    'mae_loss': float(loss),
+                    'rule': 'loss',
+                    'anomaly': True,
+                })
+
+    # Mengembalikan antrian subscriber baru, atau None jika batas stream tercapai atau worker sedang berhenti
+    def subscribe(self):
+        with self._lock:
+            if self.closed or len(self.subscribers) >= self.max_subscribers:
+                self.rejected_subscribers += 1
+                return None
+            subscriber = queue.Queue(maxsize=SUBSCRIBER_QUEUE)
+            self.subscribers.append(subscriber)
+        return subscriber
+
+    # Boleh dipanggil lebih dari sekali (dari generator maupun saat response ditutup)
+    def unsubscribe(self, subscriber):
+        with self._lock:
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+
+    # Dipanggil saat worker menerima SIGTERM: semua stream diakhiri supaya graceful shutdown tidak
+    # menunggu GRACEFUL_TIMEOUT penuh, dan stream baru ditolak
+    def close(self):
+        self.closed = True
+        for subscriber in list(self.subscribers):
+            try:
+                subscriber.put_nowait(CLOSED)
+            except queue.Full:
+                # Antrian penuh: generator tetap berhenti karena memeriksa self.closed
+                pass
+
+    def publish(self, event):
+        with self._lock:
+            subscribers = list(self.subscribers)
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(event)
+            except queue.Full:
+                # Subscriber lambat tidak boleh menahan scoring
+                self.dropped_events += 1
+
+    # Generator Server-Sent Events untuk satu subscriber (dari subscribe()), dengan filter device dan sensor opsional
+    def event_stream(self, subscriber, device=None, sensor=None):
+        try:
+            yield ': connected\n\n'
+            while not self.closed:
+                try:
+                    event = subscriber.get(timeout=HEARTBEAT_INTERVAL)
+                except queue.Empty:
+                    # Komentar heartbeat supaya koneksi tidak ditutup proxy
+                    yield ': heartbeat\n\n'
+                    continue
+                if event is CLOSED:
+                    break
+                if device and event['device'] != device:
+                    continue
+                if sensor and event['sensor'] != sensor:
+                    continue
+                yield f"event: anomaly\ndata: {json.dumps(event)}\n\n"
+        finally:
+            self.unsubscribe(subscriber)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'buffers': len(self.buffers),
+                'pending_windows': self.pending.qsize(),
+                'subscribers': len(self.subscribers),
+                'max_subscribers': self.max_subscribers,
+                'rejected_subscribers': self.rejected_subscribers,
+                'scored_windows': self.scored,
+                'anomalies': self.anomalies,
+                'dropped_events': self.dropped_events,
+            }
@@ -1,23 +1,34 @@
 import requests
 import json
+import os
+import numpy as np
 
 # URL endpoint
 url = 'http://127.0.0.1:5000/predict_conductivity'
 
-# Data input (dalam format JSON)
-data = [
-    {"value": 1.2},
-    {"value": 1.3},
-    {"value": 1.5},
-    {"value": 1.6},
-    {"value": 1.7}
-]
+# Token JWT dari /auth/login
+headers = {'Authorization': f"Bearer {os.getenv('ACCESS_TOKEN', '')}"}
+
+# Data input (dalam format JSON), minimal 31 nilai untuk satu window
+data = [{"value": 1.2 + 0.1 * (i % 5)} for i in range(40)]
 
 # Kirim request POST
-response = requests.post(url, json=data)
+response = requests.post(url, json=data, headers=headers)
 
 # Tampilkan response
 if response.status_code == 200:
     print("Response JSON:", response.json())
 else:
     print(f"Error: {response.status_code}")
+
+# Kirim data yang sama dalam format biner: waktu epoch ms (int64) + nilai (float32), little-endian
+records = np.zeros(len(data), dtype=[('time', '<i8'), ('value', '<f4')])
+records['time'] = 1722902400000 + np.arange(len(data)) * 60000
+records['value'] = [item['value'] for item in data]
+response = requests.post(url, data=records.tobytes(),
+                         headers={**headers, 'Content-Type': 'application/octet-stream'})
+
+if response.status_code == 200:
+    print("Response JSON (binary):", response.json())
+else:
+    print(f"Error: {response.status_code}")
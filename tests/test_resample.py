@@ -0,0 +1,89 @@
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from resample import check_resample_config, gap_free_windows, resample_series
+
+MINUTE = 60000
+
+
+def resample(epoch, values, gap_fill='interpolate', max_gap_seconds=300, cadence_seconds=60):
+    config = check_resample_config('sensor', {'cadence_seconds': cadence_seconds, 'gap_fill': gap_fill,
+                                              'max_gap_seconds': max_gap_seconds})
+    frame = pd.DataFrame({'time': np.asarray(epoch, dtype=np.int64), 'value': np.asarray(values, dtype=np.float64)})
+    return resample_series(frame, SimpleNamespace(resample=config))
+
+
+def test_regular_data_offset_from_grid_has_no_leading_gap():
+    # 40 titik setiap 60 detik, 40 detik setelah batas grid
+    epoch = 1_700_000_040_000 // MINUTE * MINUTE + 40000 + np.arange(40) * MINUTE
+    frame = resample(epoch, np.arange(40.0))
+    assert len(frame) == 40
+    assert not frame['value'].isna().any()
+    assert gap_free_windows(frame['value'].to_numpy(), 30).all()
+
+
+def test_burst_in_one_slot_is_averaged():
+    frame = resample([0, 10000, 20000, MINUTE], [1.0, 2.0, 3.0, 10.0])
+    assert frame['time'].tolist() == [0, MINUTE]
+    assert frame['value'].tolist() == [2.0, 10.0]
+
+
+@pytest.mark.parametrize('gap_fill, expected', [
+    ('none', [0.0, np.nan, np.nan, np.nan, 4.0]),
+    ('ffill', [0.0, 0.0, 0.0, 0.0, 4.0]),
+    ('interpolate', [0.0, 1.0, 2.0, 3.0, 4.0]),
+])
+def test_short_gap_is_filled(gap_fill, expected):
+    frame = resample([0, 4 * MINUTE], [0.0, 4.0], gap_fill=gap_fill, max_gap_seconds=180)
+    assert frame['time'].tolist() == [i * MINUTE for i in range(5)]
+    np.testing.assert_array_equal(frame['value'].to_numpy(), expected)
+
+
+def test_long_gap_collapses_to_one_empty_slot():
+    epoch = np.concatenate((np.arange(3) * MINUTE, (100 + np.arange(3)) * MINUTE))
+    frame = resample(epoch, np.arange(6.0), gap_fill='interpolate', max_gap_seconds=120)
+    assert frame['time'].tolist() == [0, MINUTE, 2 * MINUTE, 3 * MINUTE, 100 * MINUTE, 101 * MINUTE, 102 * MINUTE]
+    np.testing.assert_array_equal(frame['value'].to_numpy(), [0, 1, 2, np.nan, 3, 4, 5])
+
+
+def test_grid_size_is_bounded_by_points_not_time_span():
+    # Satu timestamp nyasar (jam di-reset ke 1970) tidak boleh membuat grid sebesar rentang waktunya
+    epoch = np.concatenate(([0], 1_700_000_000_000 + np.arange(50) * MINUTE))
+    frame = resample(epoch, np.ones(51))
+    assert len(frame) == 52
+    assert frame['value'].isna().sum() == 1
+    assert np.all(np.diff(frame['time'].to_numpy()) > 0)
+
+
+def test_missing_values_are_ignored_before_resampling():
+    frame = resample([0, MINUTE, 2 * MINUTE], [1.0, np.nan, 3.0], gap_fill='none', max_gap_seconds=0)
+    np.testing.assert_array_equal(frame['value'].to_numpy(), [1.0, np.nan, 3.0])
+
+
+def test_gap_free_windows():
+    values = np.ones(10)
+    values[4] = np.nan
+    np.testing.assert_array_equal(gap_free_windows(values, 3), [True, True, False, False, False, True, True])
+    assert len(gap_free_windows(values[:3], 3)) == 0
+
+
+@pytest.mark.parametrize('config', [
+    {'cadence_seconds': 0},
+    {'cadence_seconds': 0.0001},
+    {'gap_fill': 'none'},
+    {'cadence_seconds': 60, 'gap_fill': 'linear'},
+    {'cadence_seconds': 60, 'max_gap_seconds': -1},
+    {'cadence_seconds': 60, 'max_gap': 300},
+])
+def test_invalid_config_is_rejected(config):
+    with pytest.raises(ValueError):
+        check_resample_config('sensor', config)
+
+
+def test_config_defaults():
+    assert check_resample_config('sensor', None) is None
+    assert check_resample_config('sensor', {'cadence_seconds': 60}) == {
+        'cadence_seconds': 60, 'gap_fill': 'none', 'max_gap_seconds': 0}
@@ -0,0 +1,114 @@
+import numpy as np
+import pandas as pd
+
+from pipeline import ScoringPipeline, SensorSpec
+from sampling import DENSIFY_RATIO, coverage, densify_indices, sampling_stride, sliding_windows
+
+
+# Model palsu: prediksi selalu nol, sehingga MAE loss window = rata-rata nilai absolutnya
+class ZeroModel:
+    def __init__(self):
+        self.calls = []
+
+    def predict(self, X):
+        self.calls.append(len(X))
+        return np.zeros_like(X)
+
+
+def make_pipeline(loss_threshold=10.0):
+    spec = SensorSpec('sensor', 'unused.h5', time_steps=5, loss_threshold=loss_threshold)
+    pipeline = ScoringPipeline({'sensor': spec})
+    pipeline.models['sensor'] = ZeroModel()
+    return pipeline
+
+
+def series(values):
+    return pd.DataFrame({'time': np.arange(len(values), dtype=np.int64) * 60000,
+                         'value': np.asarray(values, dtype=np.float64)})
+
+
+def test_sliding_windows_matches_create_sequences_order():
+    values = np.arange(10.0)
+    windows = sliding_windows(values, 3)
+    assert windows.shape == (7, 3)
+    for i, window in enumerate(windows):
+        np.testing.assert_array_equal(window, values[i:i + 3])
+    assert sliding_windows(values[:3], 3).shape == (0, 3)
+
+
+def test_sampling_stride():
+    assert sampling_stride(1000) == 1
+    assert sampling_stride(1000, stride=4) == 4
+    # Pass kasar memakai paling banyak setengah budget
+    assert sampling_stride(1000, budget=100) == 20
+    assert sampling_stride(1000, stride=50, budget=100) == 50
+    assert sampling_stride(10, budget=100) == 1
+
+
+def test_densify_picks_neighbours_of_highest_loss_first():
+    indices = np.array([0, 4, 8, 12])
+    losses = np.array([0.0, 9.0, 0.0, 10.0])
+    extra = densify_indices(indices, losses, threshold=10.0, stride=4, n_windows=16, budget=100)
+    # Tetangga window 12 dulu (loss terbesar), lalu tetangga window 4; window kasar tidak diulang
+    np.testing.assert_array_equal(extra, [9, 10, 11, 13, 14, 15, 1, 2, 3, 5, 6, 7])
+
+
+def test_densify_respects_budget_threshold_and_gaps():
+    indices = np.array([0, 4, 8])
+    losses = np.array([0.0, 10.0, 0.0])
+    assert list(densify_indices(indices, losses, 10.0, 4, 12, budget=2)) == [1, 2]
+
+    valid = np.ones(12, dtype=bool)
+    valid[[2, 3]] = False
+    assert list(densify_indices(indices, losses, 10.0, 4, 12, budget=100, valid=valid)) == [1, 5, 6, 7]
+
+    below = np.array([0.0, DENSIFY_RATIO * 10.0 - 0.1, 0.0])
+    assert len(densify_indices(indices, below, 10.0, 4, 12, budget=100)) == 0
+    assert len(densify_indices(indices, losses, 10.0, 4, 12, budget=0)) == 0
+    assert len(densify_indices(indices, losses, 10.0, 1, 12, budget=100)) == 0
+
+
+def test_coverage_excludes_gap_windows_from_ratio():
+    assert coverage(100, 100) == {'windows_total': 100, 'windows_skipped_gap': 0, 'windows_scored': 100,
+                                  'ratio': 1.0, 'stride': 1, 'budget': None, 'approximate': False}
+    result = coverage(100, 20, stride=4, budget=30, skipped_gap=20)
+    assert result['ratio'] == 0.25
+    assert result['approximate'] is True
+    assert coverage(100, 80, skipped_gap=20)['approximate'] is False
+
+
+def test_score_with_stride_scores_every_kth_window():
+    pipeline = make_pipeline()
+    result = pipeline.score('sensor', series(np.ones(45)), stride=10, time_format='epoch')
+    assert result['sensor_window_index'] == [0, 10, 20, 30]
+    assert result['coverage']['windows_total'] == 40
+    assert result['coverage']['windows_scored'] == 4
+    assert result['coverage']['approximate'] is True
+    assert result['sensor_time'] == [(i + 5) * 60000 for i in (0, 10, 20, 30)]
+
+
+def test_score_with_budget_densifies_around_suspicious_window():
+    values = np.ones(45)
+    # Hanya window yang mencakup posisi 20..24 mempunyai loss tinggi
+    values[20:25] = 100.0
+    pipeline = make_pipeline(loss_threshold=10.0)
+    result = pipeline.score('sensor', series(values), budget=10, time_format='epoch')
+
+    # 40 window, budget 10: stride kasar 8 (5 window), sisa budget untuk tetangga window 16 dan 24
+    assert result['coverage']['stride'] == 8
+    assert result['coverage']['windows_scored'] <= 10
+    indices = result['sensor_window_index']
+    assert indices[:3] == [0, 8, 16]
+    assert set(indices) >= {17, 18, 19, 20}
+    assert indices == sorted(indices)
+    assert any(result['sensor_anomaly'])
+
+
+def test_score_skips_windows_that_cross_a_gap():
+    values = np.ones(20)
+    values[10] = np.nan
+    pipeline = make_pipeline()
+    result = pipeline.score('sensor', series(values), time_format='epoch')
+    assert result['coverage']['windows_skipped_gap'] == 5
+    assert result['sensor_window_index'] == [0, 1, 2, 3, 4, 5, 11, 12, 13, 14]
+    assert pipeline.models['sensor'].calls == [10]
@@ -0,0 +1,82 @@
+import argparse
+import json
+import time
+
+import numpy as np
+
+from inference import BACKENDS, load_sensor_model
+from pipeline import apply_rules, infer_losses, load_sensor_specs, parse_records, sliding_windows
+from resample import gap_free_windows, resample_series
+
+
+# Fungsi untuk menjalankan stage infer beberapa kali dan mengambil waktu median
+def timed_infer(model, windows, repeat):
+    durations = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _, mae_loss = infer_losses(model, windows)
+        durations.append(time.perf_counter() - start)
+    return mae_loss, float(np.median(durations))
+
+
+# Fungsi untuk membandingkan backend terhadap model Keras referensi
+def compare(spec, data, backends, repeat):
+    sensor_data = resample_series(parse_records(data, spec.name), spec)
+    values = sensor_data['value'].to_numpy(dtype=np.float64)
+    # Sama seperti pipeline: window yang melewati gap tidak dinilai
+    indices = np.flatnonzero(gap_free_windows(values, spec.time_steps))
+    windows = sliding_windows(values, spec.time_steps)[indices].astype(np.float32)
+    window_values = values[indices]
+
+    reference = load_sensor_model(spec.name, spec.model_path, backend='keras')
+    ref_loss, ref_time = timed_infer(reference, windows, repeat)
+    ref_anomaly = apply_rules(spec, ref_loss, window_values)
+
+    reports = []
+    for backend in backends:
+        candidate = load_sensor_model(spec.name, spec.model_path, backend=backend)
+        loss, duration = timed_infer(candidate, windows, repeat)
+        anomaly = apply_rules(spec, loss, window_values)
+        diff = np.abs(loss - ref_loss)
+        reports.append({
+            'sensor': spec.name,
+            'backend': backend,
+            'windows': int(len(windows)),
+            'max_abs_loss_diff': float(diff.max()) if len(diff) else 0.0,
+            'mean_abs_loss_diff': float(diff.mean()) if len(diff) else 0.0,
+            'anomaly_flag_mismatches': int(np.sum(anomaly != ref_anomaly)),
+            'reference_anomalies': int(ref_anomaly.sum()),
+            'candidate_anomalies': int(anomaly.sum()),
+            'reference_seconds': ref_time,
+            'candidate_seconds': duration,
+            'speedup': ref_time / duration if duration else None,
+        })
+    return reports
+
+
+def main():
+    specs = load_sensor_specs()
+
+    parser = argparse.ArgumentParser(
+        description='Compare TFLite inference backends against the reference Keras models.')
+    parser.add_argument('data', help='JSON file in the external API format, e.g. {"conductivity": [{"time": ..., "value": ...}]}')
+    parser.add_argument('--sensor', choices=sorted(specs), action='append',
+                        help='Sensor to validate (default: every sensor present in the data file)')
+    parser.add_argument('--backend', choices=[b for b in BACKENDS if b != 'keras'], action='append',
+                        help='Backend to validate (default: all TFLite backends)')
+    parser.add_argument('--repeat', type=int, default=5, help='Timing repetitions per backend')
+    args = parser.parse_args()
+
+    with open(args.data) as f:
+        data = json.load(f)
+
+    sensors = args.sensor or [s for s in specs if s in data]
+    backends = args.backend or [b for b in BACKENDS if b != 'keras']
+
+    for sensor in sensors:
+        for report in compare(specs[sensor], data, backends, args.repeat):
+            print(json.dumps(report))
+
+
+if __name__ == '__main__':
+    main()